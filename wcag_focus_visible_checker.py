@@ -3,7 +3,7 @@
 # ======================================
 #
 # 使い方 (Usage):
-#   python /home/ec2-user/a11y/wcag_focus_visible_checker/wcag_focus_visible_checker.py [URL]
+#   python /home/ec2-user/a11y/wcag_focus_visible_checker/wcag_focus_visible_checker.py [URL ...]
 #
 # 説明:
 #   このツールはWebページをチェックして、キーボードフォーカスの可視性（WCAG 2.4.7）を
@@ -23,26 +23,449 @@
 #   - Anthropic API キー（config.pyに設定）
 #   - 依存パッケージ（requirements.txtに記載）
 import sys
-import time
+import asyncio
+import atexit
 import json
+import re
 import base64
+import hashlib
 import os
 import tempfile
 import shutil
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from contextlib import contextmanager
 import anthropic
 from io import BytesIO
-from PIL import Image
-from bs4 import BeautifulSoup
+from PIL import Image, ImageChops
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import JavascriptException, StaleElementReferenceException, TimeoutException
 from config import ANTHROPIC_API_KEY, CHROME_BINARY_PATH, CHROME_DRIVER_PATH, DEBUG
 
+# Maximum number of Claude batch requests in flight at once (rate limit friendly)
+MAX_CONCURRENT_REQUESTS = 5
+
+# Maximum number of full batches waiting for a request slot while the page is
+# still being walked
+BATCH_QUEUE_SIZE = 2
+
+# Claude's analyses of elements already seen during this run, reused for
+# elements with the same details and identical screenshots (e.g. navigation
+# repeated on every page); the least recently used entries are dropped first
+ANALYSIS_CACHE_SIZE = 4096
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+# Anthropic client and event loop shared by all batch requests (see _get_client)
+_client = None
+_event_loop = None
+
+# Screenshots sent to Claude are downscaled JPEGs to keep the upload small
+SCREENSHOT_MAX_SIZE = 1024
+SCREENSHOT_JPEG_QUALITY = 75
+
+# Longest time (ms) to wait for focus transitions to finish before capturing;
+# without running transitions the capture happens right after the next paint
+FOCUS_TRANSITION_TIMEOUT_MS = 300
+
+# Padding (CSS pixels) kept around the focused element when clipping screenshots.
+# Generous enough to include indicators drawn with an offset or on a parent,
+# while still far smaller than the full viewport.
+CROP_PADDING = 200
+
+# Contact sheet combining a batch's before/after pairs into one image: rows are
+# separated by a gray gap and the sheet is limited to the size Claude uses as is
+CONTACT_SHEET_MAX_SIZE = 1568
+CONTACT_SHEET_GAP = 8
+CONTACT_SHEET_BACKGROUND = (128, 128, 128)
+
+# Before/after screenshots with fewer changed pixels than this are treated as
+# identical; a pixel counts as changed when its gray level differs by more than
+# the tolerance
+PIXEL_CHANGE_THRESHOLD = 50
+PIXEL_DIFF_TOLERANCE = 10
+
+# List of commonly focusable elements
+_FOCUSABLE_SELECTORS = [
+    "a[href]", "button", "input", "select", "textarea", 
+    "[tabindex]:not([tabindex='-1'])", "[contenteditable='true']",
+    "details", "summary", "iframe", "object", "embed", "audio[controls]", 
+    "video[controls]", "[role='button']", "[role='link']", "[role='checkbox']",
+    "[role='radio']", "[role='tab']", "[role='menuitem']", "[role='combobox']"
+]
+
+# All selectors joined with commas, built once at import time
+_FOCUSABLE_SELECTOR = ", ".join(_FOCUSABLE_SELECTORS)
+
+# CDP expression counting the focusable candidates, built once with the selector
+_COUNT_FOCUSABLE_EXPRESSION = f"document.querySelectorAll({json.dumps(_FOCUSABLE_SELECTOR)}).length"
+
+# JavaScript helper that builds a unique XPath for an element. It walks up the
+# parent chain once, so the cost is proportional to the element's depth.
+_GET_PATH_TO_JS = """
+    function getPathTo(element) {
+        var parts = [];
+        while (element !== document.body) {
+            if (element.id !== '') {
+                parts.unshift('/*[@id="' + element.id + '"]');
+                return '/' + parts.join('/');
+            }
+            if (!element.parentElement)
+                return '';
+            // Count preceding siblings with the same tag; text nodes are skipped natively
+            var index = 1;
+            for (var sibling = element.previousElementSibling; sibling; sibling = sibling.previousElementSibling) {
+                if (sibling.tagName === element.tagName)
+                    index++;
+            }
+            parts.unshift(element.tagName.toLowerCase() + '[' + index + ']');
+            element = element.parentElement;
+        }
+        parts.unshift('/html/body');
+        return parts.join('/');
+    }
+"""
+
+# Record every element that receives focus, so a whole run of Tab presses can
+# be sent in one Actions call and read back afterwards
+_INSTALL_FOCUS_LOG_JS = """
+    window.__wcagFocusLog = [];
+    window.__wcagFocusListener = function(event) { window.__wcagFocusLog.push(event.target); };
+    document.addEventListener('focusin', window.__wcagFocusListener, true);
+"""
+
+# Read the recorded focus order back, together with each element's details, in a
+# single WebDriver round trip. Stops at the first element focused twice (the
+# Tab sequence wrapped around), then resets focus and scroll position.
+_READ_FOCUS_LOG_JS = _GET_PATH_TO_JS + """
+    function getElementInfo(el) {
+        var xpath = '';
+        try {
+            xpath = getPathTo(el) || '';
+        } catch (e) {}
+        return {
+            tag: el.tagName,
+            type: el.type || '',
+            id: el.id || '',
+            cls: typeof el.className === 'string' ? el.className : (el.getAttribute('class') || ''),
+            text: (el.textContent || '').slice(0, 100),
+            role: el.getAttribute('role') || '',
+            xpath: xpath
+        };
+    }
+
+    document.removeEventListener('focusin', window.__wcagFocusListener, true);
+    var log = window.__wcagFocusLog || [];
+    var seen = new Set();
+    var elements = [];
+    for (var i = 0; i < log.length; i++) {
+        var el = log[i];
+        if (seen.has(el))
+            break;
+        seen.add(el);
+        if (el === document.body || el === document.documentElement)
+            continue;
+        // Return the element itself too, so it can be focused again without any lookup
+        var info = getElementInfo(el);
+        info.element = el;
+        elements.push(info);
+    }
+    delete window.__wcagFocusLog;
+    delete window.__wcagFocusListener;
+
+    if (document.activeElement && document.activeElement.blur)
+        document.activeElement.blur();
+    window.scrollTo(0, 0);
+    return elements;
+"""
+
+# Clear the current origin's localStorage and sessionStorage; storage access
+# throws on opaque origins such as data: URLs, which have nothing to clear
+_CLEAR_STORAGE_JS = """
+    try {
+        window.localStorage.clear();
+        window.sessionStorage.clear();
+    } catch (e) {}
+"""
+
+# JavaScript helper that checks whether an element or any of its descendants has
+# a box with a size. An inline link around a floated child, or an element with
+# display: contents, has an empty rectangle of its own, but its focus ring is
+# still drawn around its content.
+_HAS_RENDERED_BOX_JS = """
+    function hasRenderedBox(el) {
+        var nodes = [el].concat(Array.prototype.slice.call(el.querySelectorAll('*')));
+        for (var i = 0; i < nodes.length; i++) {
+            var rects = nodes[i].getClientRects();
+            for (var j = 0; j < rects.length; j++) {
+                if (rects[j].width > 0 && rects[j].height > 0) {
+                    return true;
+                }
+            }
+        }
+        return false;
+    }
+"""
+
+# JavaScript helper that calls done once a focus change on an element has been
+# painted (two animation frames) and any transitions it started have finished,
+# waiting at most timeout milliseconds for the transitions
+_WAIT_FOR_FOCUS_EFFECTS_JS = """
+    function waitForFocusEffects(el, timeout, done) {
+        requestAnimationFrame(function() { requestAnimationFrame(function() {
+            // Most indicators are painted by now; only wait longer for focus transitions
+            var animations = el.getAnimations ? el.getAnimations({subtree: true}) : [];
+            if (!animations.length) {
+                done();
+                return;
+            }
+            var finished = false;
+            function finishOnce() {
+                if (!finished) {
+                    finished = true;
+                    done();
+                }
+            }
+            Promise.all(animations.map(function(animation) { return animation.finished; }))
+                .then(finishOnce, finishOnce);
+            setTimeout(finishOnce, timeout);
+        }); });
+    }
+"""
+
+# Scroll the given element into view if needed and resolve with the screenshot
+# clip around it and whether it has a rendered box. The clip is its bounding
+# rectangle plus padding (arguments[1]), limited to the visible viewport and
+# expressed in page coordinates as Page.captureScreenshot expects; its scale
+# keeps the longest edge within arguments[2] pixels. Resolves null if the
+# element is no longer in the document.
+_PREPARE_ELEMENT_JS = _HAS_RENDERED_BOX_JS + """
+    var callback = arguments[arguments.length - 1];
+    var el = arguments[0];
+    var padding = arguments[1];
+    var maxSize = arguments[2];
+    if (!el || !el.isConnected) {
+        callback(null);
+        return;
+    }
+    function measure() {
+        var r = el.getBoundingClientRect();
+        var left = Math.max(0, r.left - padding);
+        var top = Math.max(0, r.top - padding);
+        var right = Math.min(window.innerWidth, r.right + padding);
+        var bottom = Math.min(window.innerHeight, r.bottom + padding);
+        // Fall back to the whole viewport if the element is not inside it
+        if (right <= left || bottom <= top) {
+            left = 0;
+            top = 0;
+            right = window.innerWidth;
+            bottom = window.innerHeight;
+        }
+        var width = right - left;
+        var height = bottom - top;
+        callback({
+            clip: {
+                x: left + window.scrollX,
+                y: top + window.scrollY,
+                width: width,
+                height: height,
+                scale: Math.min(1, maxSize / Math.max(width, height))
+            },
+            rendered: hasRenderedBox(el)
+        });
+    }
+    var rect = el.getBoundingClientRect();
+    if (rect.top < 0 || rect.left < 0 ||
+            rect.bottom > window.innerHeight || rect.right > window.innerWidth) {
+        el.scrollIntoView({block: 'center', inline: 'nearest', behavior: 'instant'});
+        // Wait for the scrolled page to be painted before it is captured
+        requestAnimationFrame(function() { requestAnimationFrame(measure); });
+    } else {
+        measure();
+    }
+"""
+
+# Focus the given element and resolve once the focus change has been painted
+# and any transitions it started have finished (at most arguments[1]
+# milliseconds), with whether it has a rendered box and its focus-related
+# computed styles before and after focusing. Resolves null if the element
+# cannot take focus or loses it again.
+_FOCUS_ELEMENT_JS = _HAS_RENDERED_BOX_JS + _WAIT_FOR_FOCUS_EFFECTS_JS + """
+    var callback = arguments[arguments.length - 1];
+    var el = arguments[0];
+    var transitionTimeout = arguments[1];
+    function readStyles() {
+        var style = window.getComputedStyle(el);
+        var styles = {};
+        ['outline-style', 'outline-width', 'outline-color', 'box-shadow',
+         'border-style', 'border-width', 'border-color', 'background-color',
+         'color', 'text-decoration-line'].forEach(function(name) {
+            styles[name] = style.getPropertyValue(name);
+        });
+        return styles;
+    }
+    var stylesBefore = readStyles();
+    el.focus({preventScroll: true});
+    if (document.activeElement !== el) {
+        callback(null);
+        return;
+    }
+    waitForFocusEffects(el, transitionTimeout, function() {
+        // Page scripts may have moved focus elsewhere in the meantime
+        if (document.activeElement !== el) {
+            callback(null);
+            return;
+        }
+        callback({
+            rendered: hasRenderedBox(el),
+            styles_before: stylesBefore,
+            styles_after: readStyles()
+        });
+    });
+"""
+
+# Remove focus from the given element and resolve once the change has been
+# painted and its transitions have finished (at most arguments[1] milliseconds)
+_BLUR_ELEMENT_JS = _WAIT_FOR_FOCUS_EFFECTS_JS + """
+    var callback = arguments[arguments.length - 1];
+    var el = arguments[0];
+    el.blur();
+    waitForFocusEffects(el, arguments[1], function() { callback(true); });
+"""
+
+# Colors in computed style values, and the fully transparent ones among them
+_CSS_COLOR_RE = re.compile(r'rgba?\([^)]*\)|transparent')
+_TRANSPARENT_COLOR_RE = re.compile(r'rgba\([^)]*,\s*0(\.0+)?\)')
+
+# Outermost JSON object in a plain text answer, used when no tool call comes back
+_JSON_RE = re.compile(r'\{.*\}', re.S)
+
+# Tool definition Claude is forced to call, so its answer arrives as structured JSON
+_REPORT_TOOL = {
+    "name": "report_focus_analysis",
+    "description": "各要素のフォーカス可視性の分析結果を報告します",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "elements": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "tab_index": {"type": "integer"},
+                        "element_tag": {"type": "string"},
+                        "element_type": {"type": "string"},
+                        "element_id": {"type": "string"},
+                        "element_class": {"type": "string"},
+                        "element_text": {"type": "string"},
+                        "element_role": {"type": "string"},
+                        "element_xpath": {"type": "string"},
+                        "analysis": {
+                            "type": "object",
+                            "properties": {
+                                "focus_visible": {"type": "boolean"},
+                                "focus_indicator_description": {"type": "string"},
+                                "compliance_techniques": {"type": "array", "items": {"type": "string"}},
+                                "recommendation": {"type": "string"}
+                            },
+                            "required": ["focus_visible", "focus_indicator_description"]
+                        }
+                    },
+                    "required": ["tab_index", "element_tag", "analysis"]
+                }
+            }
+        },
+        "required": ["elements"]
+    }
+}
+
+# Example output format shown to Claude
+_FORMAT_EXAMPLE = '''{
+  "elements": [
+    {
+      "tab_index": 0,
+      "element_tag": "A",
+      "element_type": "",
+      "element_id": "main-logo",
+      "element_class": "navbar-brand",
+      "element_text": "Home",
+      "element_role": "",
+      "element_xpath": "/html/body/header/nav/a[1]",
+      "analysis": {
+        "focus_visible": true,
+        "focus_indicator_description": "Blue outline around the element with 2px thickness",
+        "compliance_techniques": [
+          "G165: Using the default focus indicator for the platform",
+          "C15: Using CSS to change the presentation of a user interface component when it receives focus"
+        ],
+        "recommendation": "Current implementation is compliant with WCAG 2.4.7"
+      }
+    }
+  ]
+}'''
+
+# Fixed instructions of the analysis prompt, identical for every batch. They are
+# sent ahead of the per-batch content and marked for prompt caching, so repeated
+# batches reuse them instead of having them processed again.
+_PROMPT_INSTRUCTIONS = """# あなたはWCAG 2.4.7 フォーカス可視性の評価を専門とするアクセシビリティテストの専門家です。あなたの任務は、要素がキーボードフォーカスを受けた時に可視的なフォーカス表示があるかどうかを分析することです。
+
+# WCAG 2.4.7 フォーカス可視性の要件:
+キーボード操作可能なユーザーインターフェースには、キーボードフォーカスインジケータが視覚的に確認できる操作モードがあること。
+
+# 各要素の画像は1枚のコンタクトシートにまとめて表示されます。各行が1つの要素に対応し:
+1. 左: 要素がフォーカスを受ける前（前のタブの後）
+2. 右: 要素がフォーカスを受けた後（現在のタブ）
+どちらの画像も、対象要素とその周囲を切り出したものです。
+
+これらの画像を比較して、要素がキーボードフォーカスを受けた時に視覚的なフォーカス表示があるかどうかを判断してください。
+
+# 一般的なフォーカス表示には以下が含まれます:
+- アウトライン（実線、点線、破線）
+- 背景色の変化
+- 境界線の変化
+- ボックスシャドウ
+- テキスト色の変化
+- 下線やその他の装飾
+- サイズや形状の変化
+
+# 各要素について、以下を判断してください:
+1. 視覚的なフォーカス表示があるか？ (true/false)
+2. 表示がある場合、そのフォーカス表示を説明してください
+3. 使用されているWCAG技術を特定してください:
+   - G165: プラットフォームのデフォルトフォーカス表示を使用
+   - G195: 作成者が提供する視覚的なフォーカス表示を使用
+   - C15: フォーカスを受けた時にCSSで表示を変更
+   - C40: 十分なコントラストを持つ二色のフォーカス表示を作成
+   - SCR31: スクリプトを使用してフォーカス時に背景色または境界線を変更
+   - F78: フォーカス表示を削除または非表示にするスタイリングの失敗
+
+# 以下の画像は、フォーカス可視性のテスト対象となる要素を示しています。
+# 「フォーカス前」と「フォーカス後」の画像のペアを注意深く分析してください。
+
+# 回答のフォーマット（report_focus_analysis ツールで回答してください）:
+""" + _FORMAT_EXAMPLE
+
+# System prompt blocks; the cache breakpoint on the last block covers the tool
+# definition and everything in the system prompt
+_SYSTEM_PROMPT = [
+    {
+        "type": "text",
+        "text": "あなたはWCAGコンプライアンス評価、特にキーボードユーザー向けのフォーカス可視性に特化したアクセシビリティテストの専門家です。"
+    },
+    {
+        "type": "text",
+        "text": _PROMPT_INSTRUCTIONS,
+        "cache_control": {"type": "ephemeral"}
+    }
+]
+
 def setup_driver():
     """
     Set up and return a Chrome WebDriver instance
@@ -83,6 +506,8 @@ def setup_driver():
     # ChromeDriverの設定
     service = Service(executable_path=CHROME_DRIVER_PATH)
     driver = webdriver.Chrome(service=service, options=options)
+    # Async scripts only wait for a couple of frames, so fail fast if they hang
+    driver.set_script_timeout(2)
     return driver, temp_dir
 
 def cleanup_temp_dir(temp_dir):
@@ -96,36 +521,80 @@ def cleanup_temp_dir(temp_dir):
     except Exception as e:
         print(f"警告: 一時ディレクトリの削除に失敗しました: {e}")
 
-def get_focusable_elements(driver):
+def count_focusable_elements(driver):
     """
-    Get a list of potentially focusable elements
+    Count the potentially focusable elements with a single CDP evaluation,
+    without materializing a WebElement for each match
     """
-    # List of commonly focusable elements
-    selectors = [
-        "a[href]", "button", "input", "select", "textarea", 
-        "[tabindex]:not([tabindex='-1'])", "[contenteditable='true']",
-        "details", "summary", "iframe", "object", "embed", "audio[controls]", 
-        "video[controls]", "[role='button']", "[role='link']", "[role='checkbox']",
-        "[role='radio']", "[role='tab']", "[role='menuitem']", "[role='combobox']"
-    ]
-    
-    # Join all selectors with commas
-    combined_selector = ", ".join(selectors)
+    response = driver.execute_cdp_cmd("Runtime.evaluate", {
+        "expression": _COUNT_FOCUSABLE_EXPRESSION,
+        "returnByValue": True
+    })
+    count = response["result"]["value"]
     
-    # Find all potentially focusable elements
-    elements = driver.find_elements(By.CSS_SELECTOR, combined_selector)
+    print(f"フォーカス可能な候補要素を {count} 個見つけました")
+    return count
+
+def collect_focusable_elements(driver, body, max_tabs):
+    """
+    Collect details of the focusable elements in keyboard focus order by sending
+    up to max_tabs Tab presses to the page body in a single send_keys call
+    """
+    driver.execute_script(_INSTALL_FOCUS_LOG_JS)
+    body.send_keys(Keys.TAB * max_tabs)
+    elements = driver.execute_script(_READ_FOCUS_LOG_JS)
     
     print(f"フォーカス可能な要素を {len(elements)} 個見つけました")
     return elements
 
-def check_focus_visibility(url):
+def prepare_element(driver, element):
     """
-    Check focus visibility on a webpage by tabbing through interactive elements
+    Scroll an element collected by collect_focusable_elements into view and
+    return the screenshot clip around it and whether it is rendered (see
+    _PREPARE_ELEMENT_JS), or None if it is no longer on the page or the script fails
+    """
+    try:
+        return driver.execute_async_script(_PREPARE_ELEMENT_JS, element, CROP_PADDING, SCREENSHOT_MAX_SIZE)
+    except StaleElementReferenceException:
+        # The element was removed from the page since it was collected
+        return None
+    except (TimeoutException, JavascriptException) as e:
+        # A slow or failing page script affects only this element
+        print(f"警告: 要素の準備中にスクリプトが失敗しました: {e.msg}")
+        return None
+
+def focus_element(driver, element):
+    """
+    Focus an element and return its computed styles before and after focusing
+    (see _FOCUS_ELEMENT_JS), or None if it could not be focused
+    """
+    try:
+        return driver.execute_async_script(_FOCUS_ELEMENT_JS, element, FOCUS_TRANSITION_TIMEOUT_MS)
+    except StaleElementReferenceException:
+        return None
+    except (TimeoutException, JavascriptException) as e:
+        print(f"警告: 要素へのフォーカス中にスクリプトが失敗しました: {e.msg}")
+        return None
+
+def blur_element(driver, element):
+    """Remove focus from an element, returning False if it is gone or the script fails"""
+    try:
+        return driver.execute_async_script(_BLUR_ELEMENT_JS, element, FOCUS_TRANSITION_TIMEOUT_MS)
+    except StaleElementReferenceException:
+        return False
+    except (TimeoutException, JavascriptException) as e:
+        print(f"警告: 要素のフォーカス解除中にスクリプトが失敗しました: {e.msg}")
+        return False
+
+def start_driver():
+    """
+    Set up the Chrome WebDriver, printing troubleshooting hints if it fails
     """
     try:
         print("Chrome WebDriverを設定中...")
         driver, temp_dir = setup_driver()
         print(f"Chrome WebDriverの設定が完了しました。一時ディレクトリ: {temp_dir}")
+        return driver, temp_dir
     except Exception as e:
         print(f"Chrome WebDriverの設定エラー: {e}")
         if "DevToolsActivePort file doesn't exist" in str(e):
@@ -137,6 +606,26 @@ def check_focus_visibility(url):
             print(f"5. 現在のChromeDriverパス: {CHROME_DRIVER_PATH}")
             print("6. 既存のChromeプロセスを終了してみてください: pkill -f chrome")
         raise
+
+@contextmanager
+def driver_session():
+    """
+    Start one Chrome instance for a series of pages and yield (driver, temp_dir);
+    the browser is shut down and its data directory removed on exit
+    """
+    driver, temp_dir = start_driver()
+    try:
+        yield driver, temp_dir
+    finally:
+        driver.quit()
+        cleanup_temp_dir(temp_dir)
+
+def check_focus_visibility(driver, url):
+    """
+    Check focus visibility on a webpage by tabbing through interactive elements,
+    using a driver from driver_session()
+    """
+    screenshot_dir = tempfile.mkdtemp()
     
     try:
         # Navigate to URL
@@ -150,344 +639,697 @@ def check_focus_visibility(url):
         
         print("ページの読み込みが完了しました")
         
-        # Get initial page source and screenshot for reference
-        initial_source = driver.page_source
-        initial_screenshot = take_screenshot(driver)
-        
-        # Initialize focus results
-        focus_results = []
-        
         # Reset focus to the top of the page
         body = driver.find_element(By.TAG_NAME, "body")
         body.click()
         body.send_keys(Keys.HOME)
         
-        # Loop through the page by pressing Tab
-        tab_index = 0
-        previously_focused_elements = set()
+        # Find the keyboard focus order first; this leaves the page in keyboard
+        # modality, so programmatic focus below shows the same indicator a Tab
+        # press would. One Tab more than there are candidates is enough to see
+        # the sequence wrap around.
         max_tabs = 100  # Limit to prevent infinite loops
+        max_tabs = min(max_tabs, count_focusable_elements(driver) + 1)
+        focusable_elements = collect_focusable_elements(driver, body, max_tabs)
         
-        while tab_index < max_tabs:
-            # Capture before pressing Tab
-            before_tab_screenshot = take_screenshot(driver)
-            
-            # Press Tab to focus the next element
-            ActionChains(driver).send_keys(Keys.TAB).perform()
-            time.sleep(0.5)  # Short delay to let focus effects render
-            
-            # Get the currently focused element
-            active_element = driver.execute_script("return document.activeElement;")
-            
-            # Get element details
-            element_tag = driver.execute_script("return document.activeElement.tagName;")
-            element_type = driver.execute_script("return document.activeElement.type || '';")
-            element_id = driver.execute_script("return document.activeElement.id || '';")
-            element_class = driver.execute_script("return document.activeElement.className || '';")
-            element_text = driver.execute_script("return document.activeElement.textContent || '';")
-            element_role = driver.execute_script("return document.activeElement.getAttribute('role') || '';")
-            
-            # Try to get a useful identifier
-            element_identifier = element_id or element_class or element_text[:50] or f"{element_tag}[{tab_index}]"
-            
-            # Get XPath for the focused element
-            try:
-                element_xpath = generate_xpath(driver, active_element)
-            except:
-                element_xpath = "Unknown"
-            
-            # Check if we've cycled back to an element we've seen before
-            element_signature = f"{element_tag}_{element_id}_{element_class}_{element_xpath}"
-            if element_signature in previously_focused_elements:
-                print(f"インデックス {tab_index} で以前フォーカスした要素に戻りました。タブシーケンスを停止します。")
-                break
-            
-            previously_focused_elements.add(element_signature)
-            
-            # Take screenshot with the element focused
-            after_tab_screenshot = take_screenshot(driver)
-            
-            # Capture element details
-            element_info = {
-                "tab_index": tab_index,
-                "element_tag": element_tag,
-                "element_type": element_type,
-                "element_id": element_id,
-                "element_class": element_class,
-                "element_text": element_text[:100] if element_text else "",
-                "element_role": element_role,
-                "element_xpath": element_xpath,
-                "before_tab_screenshot": before_tab_screenshot,
-                "after_tab_screenshot": after_tab_screenshot
-            }
+        # Walk the page and analyze the results as they are produced
+        focus_results = walk_focus_results(driver, focusable_elements, screenshot_dir)
+        return _run_async(process_focus_results(focus_results, url))
+        
+    finally:
+        cleanup_temp_dir(screenshot_dir)
+
+def walk_focus_results(driver, focusable_elements, screenshot_dir):
+    """
+    Focus each element in turn and yield its details, screenshot paths and
+    style change. Being a generator, the walk proceeds only as fast as the
+    results are consumed.
+    """
+    # Walk the focusable elements in focus order, focusing each one in turn
+    tab_index = 0
+    
+    for element_data in focusable_elements:
+        element_tag = element_data["tag"]
+        element_type = element_data["type"]
+        element_id = element_data["id"]
+        element_class = element_data["cls"]
+        element_text = element_data["text"]
+        element_role = element_data["role"]
+        element_xpath = element_data["xpath"] or "Unknown"
+        
+        # Try to get a useful identifier
+        element_identifier = element_id or element_class or element_text[:50] or f"{element_tag}[{tab_index}]"
+        
+        # Only the area around the element matters for the analysis, so
+        # Chrome captures and encodes just that region, before and after focus
+        prepared = prepare_element(driver, element_data["element"])
+        if not prepared:
+            print(f"要素 {element_tag} ({element_identifier}) にフォーカスできませんでした。スキップします。")
+            continue
+        clip = prepared["clip"]
+        # An element without a rendered box is captured only if focusing it
+        # makes it appear
+        before_tab_screenshot = take_screenshot(driver, clip) if prepared["rendered"] else None
+        
+        # Focus the element and wait until the focus effects are rendered
+        focus_state = focus_element(driver, element_data["element"])
+        if focus_state and focus_state["rendered"] and before_tab_screenshot is None:
+            # The element appeared on focus (e.g. a skip link): take the clip
+            # around it while it is shown, then capture it unfocused and focus
+            # it again
+            prepared = prepare_element(driver, element_data["element"])
+            if prepared and blur_element(driver, element_data["element"]):
+                clip = prepared["clip"]
+                before_tab_screenshot = take_screenshot(driver, clip)
+                focus_state = focus_element(driver, element_data["element"])
+            else:
+                focus_state = None
+        if not focus_state:
+            print(f"要素 {element_tag} ({element_identifier}) にフォーカスできませんでした。スキップします。")
+            continue
+        
+        before_tab_screenshot_path = None
+        after_tab_screenshot_path = None
+        style_change = None
+        screenshots_identical = False
+        screenshot_digests = None
+        # An element with no rendered box while focused cannot show a focus
+        # indicator, so it is only recorded as not rendered
+        if focus_state["rendered"] and before_tab_screenshot is not None:
+            after_tab_screenshot = take_screenshot(driver, clip)
+            # The captures are encoded deterministically, so an unchanged
+            # rendering gives byte-identical data
+            screenshots_identical = before_tab_screenshot == after_tab_screenshot
+            screenshot_digests = (
+                hashlib.blake2b(before_tab_screenshot.encode(), digest_size=16).hexdigest(),
+                hashlib.blake2b(after_tab_screenshot.encode(), digest_size=16).hexdigest()
+            )
             
-            focus_results.append(element_info)
-            print(f"要素を処理しました {tab_index}: {element_tag} ({element_identifier})")
+            # The screenshots are kept on disk rather than in memory until they are analyzed
+            before_tab_screenshot_path = save_screenshot(
+                screenshot_dir, f"{tab_index}_before.jpg", base64.b64decode(before_tab_screenshot)
+            )
+            after_tab_screenshot_path = save_screenshot(
+                screenshot_dir, f"{tab_index}_after.jpg", base64.b64decode(after_tab_screenshot)
+            )
             
-            tab_index += 1
+            # Focus indicators drawn with plain CSS can be detected without Claude
+            style_change = describe_style_change(focus_state["styles_before"], focus_state["styles_after"])
         
-        # Process results
-        return process_focus_results(focus_results, initial_screenshot, url)
+        # Capture element details
+        element_info = {
+            "tab_index": tab_index,
+            "element_tag": element_tag,
+            "element_type": element_type,
+            "element_id": element_id,
+            "element_class": element_class,
+            "element_text": element_text,
+            "element_role": element_role,
+            "element_xpath": element_xpath,
+            "before_tab_screenshot_path": before_tab_screenshot_path,
+            "after_tab_screenshot_path": after_tab_screenshot_path,
+            "rendered": focus_state["rendered"],
+            "screenshots_identical": screenshots_identical,
+            "screenshot_digests": screenshot_digests,
+            "style_change": style_change
+        }
         
-    finally:
-        driver.quit()
-        cleanup_temp_dir(temp_dir)
+        print(f"要素を処理しました {tab_index}: {element_tag} ({element_identifier})")
+        yield element_info
+        
+        tab_index += 1
 
-def generate_xpath(driver, element):
-    """Generate a unique XPath for an element"""
-    return driver.execute_script("""
-    function getPathTo(element) {
-        if (element.id !== '')
-            return '//*[@id="' + element.id + '"]';
-        if (element === document.body)
-            return '/html/body';
-
-        var index = 0;
-        var siblings = element.parentNode.childNodes;
-        for (var i = 0; i < siblings.length; i++) {
-            var sibling = siblings[i];
-            if (sibling === element)
-                return getPathTo(element.parentNode) + '/' + element.tagName.toLowerCase() + '[' + (index + 1) + ']';
-            if (sibling.nodeType === 1 && sibling.tagName === element.tagName)
-                index++;
-        }
+def scan_urls(urls):
+    """
+    Check several URLs with a single Chrome instance so the browser start-up
+    cost is paid only once. Returns a list of (url, report) pairs; the report is
+    None for URLs that could not be checked.
+    """
+    results = []
+    with driver_session() as (driver, _):
+        for url in urls:
+            print(f"{url} のフォーカス可視性チェックを開始")
+            try:
+                results.append((url, check_focus_visibility(driver, url)))
+            except Exception as e:
+                print(f"エラー: {url} のチェック中に問題が発生しました: {e}")
+                results.append((url, None))
+            # Clear the cookies and web storage of the page just checked. Both
+            # are per origin, so only the current document's origin is cleared.
+            try:
+                driver.delete_all_cookies()
+                driver.execute_script(_CLEAR_STORAGE_JS)
+            except Exception as e:
+                print(f"警告: {url} のCookieとストレージを削除できませんでした: {e}")
+    return results
+
+def take_screenshot(driver, clip=None):
+    """
+    Take a JPEG screenshot via CDP, optionally limited to a clip region, and
+    return it as a base64 string. Chrome encodes only the requested region.
+    """
+    params = {
+        "format": "jpeg",
+        "quality": SCREENSHOT_JPEG_QUALITY,
+        "captureBeyondViewport": False
     }
-    return getPathTo(arguments[0]);
-    """, element)
+    if clip:
+        params["clip"] = clip
+    screenshot = driver.execute_cdp_cmd("Page.captureScreenshot", params)
+    return screenshot["data"]
 
-def take_screenshot(driver):
-    """Take a screenshot and convert to base64 for storage"""
-    screenshot = driver.get_screenshot_as_png()
-    buffered = BytesIO(screenshot)
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+def save_screenshot(directory, filename, data):
+    """Write screenshot bytes to a file in directory and return its path"""
+    path = os.path.join(directory, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
 
-def process_focus_results(focus_results, initial_screenshot, url):
+def build_contact_sheet(focus_batch):
     """
-    Analyze focus results to determine visibility
+    Combine the before/after screenshots of a batch into one JPEG image with
+    one row per element: before on the left, after on the right
     """
-    # Prepare batches of elements for analysis (limit of 5 per batch for better image handling)
-    batch_size = 5
-    batches = [focus_results[i:i+batch_size] for i in range(0, len(focus_results), batch_size)]
+    pairs = []
+    for element in focus_batch:
+        with Image.open(element["before_tab_screenshot_path"]) as before, \
+                Image.open(element["after_tab_screenshot_path"]) as after:
+            pairs.append((before.convert("RGB"), after.convert("RGB")))
     
-    all_analyzed_results = []
+    cell_width = max(image.width for pair in pairs for image in pair)
+    row_heights = [max(before.height, after.height) for before, after in pairs]
+    gap = CONTACT_SHEET_GAP
+    sheet = Image.new(
+        "RGB",
+        (cell_width * 2 + gap, sum(row_heights) + gap * (len(pairs) - 1)),
+        CONTACT_SHEET_BACKGROUND
+    )
+    y = 0
+    for (before, after), row_height in zip(pairs, row_heights):
+        sheet.paste(before, (0, y))
+        sheet.paste(after, (cell_width + gap, y))
+        y += row_height + gap
     
-    for batch_idx, batch in enumerate(batches):
-        print(f"フォーカス結果のバッチ {batch_idx+1}/{len(batches)} を解析中")
-        try:
-            analyzed_batch = analyze_focus_batch(batch, initial_screenshot, url)
-            if analyzed_batch:
-                all_analyzed_results.extend(analyzed_batch)
-            else:
-                print(f"警告: バッチ {batch_idx+1} の解析結果がありません。スキップします。")
-        except Exception as e:
-            print(f"エラー: バッチ {batch_idx+1} の解析中に問題が発生しました: {e}")
-            print("バッチをスキップして続行します...")
+    # Claude scales larger images down anyway, so do it before uploading
+    sheet.thumbnail((CONTACT_SHEET_MAX_SIZE, CONTACT_SHEET_MAX_SIZE), Image.LANCZOS)
+    buffered = BytesIO()
+    sheet.save(buffered, format="JPEG", quality=SCREENSHOT_JPEG_QUALITY, optimize=True)
+    return buffered.getvalue()
+
+def element_details(element):
+    """Return the element details without the screenshots"""
+    return {
+        "tab_index": element["tab_index"],
+        "element_tag": element["element_tag"],
+        "element_type": element["element_type"],
+        "element_id": element["element_id"],
+        "element_class": element["element_class"],
+        "element_text": element["element_text"],
+        "element_role": element["element_role"],
+        "element_xpath": element["element_xpath"]
+    }
+
+def _is_transparent(value):
+    """
+    Check whether every color in a computed style value (a color, a per-side
+    border color list or a box-shadow list) is fully transparent
+    """
+    colors = _CSS_COLOR_RE.findall(value or "")
+    return bool(colors) and all(
+        color == "transparent" or _TRANSPARENT_COLOR_RE.fullmatch(color) for color in colors
+    )
+
+def _has_width(width):
+    """Check whether a computed width value has a non-zero width on any side"""
+    return any(side != "0px" for side in (width or "0px").split())
+
+def describe_style_change(styles_before, styles_after):
+    """
+    Compare computed styles before and after focus and describe the visible focus
+    indicator they produce. Returns None when no visible style change was found.
+    """
+    def changed(name):
+        return styles_before.get(name) != styles_after.get(name)
+    
+    changes = []
+    outline_style = styles_after.get("outline-style", "none")
+    outline_width = styles_after.get("outline-width", "0px")
+    outline_color = styles_after.get("outline-color", "")
+    if (any(changed(name) for name in ("outline-style", "outline-width", "outline-color"))
+            and outline_style != "none" and _has_width(outline_width)
+            and not _is_transparent(outline_color)):
+        changes.append(f"アウトライン ({outline_width} {outline_style} {outline_color})")
+    box_shadow = styles_after.get("box-shadow", "none")
+    if changed("box-shadow") and box_shadow != "none" and not _is_transparent(box_shadow):
+        changes.append(f"ボックスシャドウ ({box_shadow})")
+    border_style = styles_after.get("border-style", "none")
+    border_width = styles_after.get("border-width", "0px")
+    border_color = styles_after.get("border-color", "")
+    if (any(changed(name) for name in ("border-style", "border-width", "border-color"))
+            and any(side not in ("none", "hidden") for side in border_style.split())
+            and _has_width(border_width) and not _is_transparent(border_color)):
+        changes.append(f"境界線 ({border_width} {border_style} {border_color})")
+    if changed("background-color") and not (
+            _is_transparent(styles_before.get("background-color"))
+            and _is_transparent(styles_after.get("background-color"))):
+        changes.append(f"背景色 ({styles_before.get('background-color')} → {styles_after.get('background-color')})")
+    if changed("color"):
+        changes.append(f"テキスト色 ({styles_before.get('color')} → {styles_after.get('color')})")
+    if changed("text-decoration-line") and styles_after.get("text-decoration-line", "none") != "none":
+        changes.append(f"テキスト装飾 ({styles_after['text-decoration-line']})")
     
-    # Categorize results
+    if not changes:
+        return None
+    return {
+        "description": "フォーカス時に計算済みスタイルが変化します: " + "、".join(changes),
+        "platform_default": outline_style == "auto"
+    }
+
+def count_changed_pixels(before_screenshot_path, after_screenshot_path):
+    """Count the pixels that differ noticeably between two screenshot files"""
+    with Image.open(before_screenshot_path) as before_image, Image.open(after_screenshot_path) as after_image:
+        before = before_image.convert("L")
+        after = after_image.convert("L")
+    if before.size != after.size:
+        return before.width * before.height
+    # Ignore small differences such as JPEG noise, then count what is left
+    diff = ImageChops.difference(before, after).point(
+        lambda value: 255 if value > PIXEL_DIFF_TOLERANCE else 0
+    )
+    return diff.histogram()[255]
+
+def remove_screenshots(element):
+    """Delete an element's before/after screenshot files once they are no longer needed"""
+    for key in ("before_tab_screenshot_path", "after_tab_screenshot_path"):
+        if element.get(key):
+            try:
+                os.remove(element[key])
+            except OSError:
+                pass
+
+def analysis_cache_key(element):
+    """Return the key identifying an element and its screenshots in the analysis cache"""
+    details = element_details(element)
+    del details["tab_index"]
+    return tuple(details.values()) + element["screenshot_digests"]
+
+def get_cached_analysis(key):
+    """Return a copy of the cached analysis for key, or None"""
+    with _analysis_cache_lock:
+        analysis = _analysis_cache.get(key)
+        if analysis is None:
+            return None
+        _analysis_cache.move_to_end(key)
+        return dict(analysis)
+
+def cache_analysis(key, analysis):
+    """Store an analysis in the cache, evicting the least recently used entry if full"""
+    with _analysis_cache_lock:
+        _analysis_cache[key] = analysis
+        _analysis_cache.move_to_end(key)
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+def decide_locally(element):
+    """
+    Return the analysis result for an element whose focus visibility can be
+    decided without Claude, or None if it needs Claude's analysis
+    """
+    if not element.get("rendered", True):
+        result = element_details(element)
+        result["analysis"] = {
+            "focus_visible": False,
+            "rendered": False,
+            "focus_indicator_description": "フォーカス時に要素が描画されていません（要素にも子孫にも表示領域がありません）",
+            "compliance_techniques": [],
+            "recommendation": "フォーカスを受けた時に要素とそのフォーカス表示が描画されるようにしてください"
+        }
+        return result
+    
+    style_change = element.get("style_change")
+    if style_change:
+        result = element_details(element)
+        techniques = ["C15: フォーカスを受けた時にCSSで表示を変更"]
+        if style_change["platform_default"]:
+            techniques.insert(0, "G165: プラットフォームのデフォルトフォーカス表示を使用")
+        result["analysis"] = {
+            "focus_visible": True,
+            "focus_indicator_description": style_change["description"],
+            "compliance_techniques": techniques,
+            "recommendation": "現在の実装はWCAG 2.4.7に準拠しています"
+        }
+        return result
+    
+    # Identical captures need no decoding; otherwise count the pixels that
+    # changed beyond JPEG noise
+    if element.get("screenshots_identical") or count_changed_pixels(
+        element["before_tab_screenshot_path"], element["after_tab_screenshot_path"]
+    ) < PIXEL_CHANGE_THRESHOLD:
+        result = element_details(element)
+        result["analysis"] = {
+            "focus_visible": False,
+            "focus_indicator_description": "フォーカス前後で画面に変化がありません",
+            "compliance_techniques": [],
+            "recommendation": "この要素にフォーカス表示を追加してください"
+        }
+        return result
+    
+    return None
+
+async def process_focus_results(focus_results, url):
+    """
+    Analyze focus results to determine visibility. focus_results is consumed in
+    a worker thread, and each batch is sent to Claude as soon as it is full, so
+    the analysis overlaps with the walk through the page.
+    """
+    loop = asyncio.get_running_loop()
+    analyzed_count = 0
+    local_count = 0
+    cached_count = 0
     visible_focus_elements = []
     invisible_focus_elements = []
+    not_rendered_elements = []
     
-    for result in all_analyzed_results:
+    def categorize(result):
+        nonlocal analyzed_count
+        analyzed_count += 1
         # 結果が正しい形式かチェック
         if 'analysis' not in result:
             print(f"警告: 要素 {result.get('tab_index', '不明')} の分析結果が不完全です。スキップします。")
-            continue
+            return
             
-        if result['analysis'].get('focus_visible', False):
+        if not result['analysis'].get('rendered', True):
+            not_rendered_elements.append(result)
+        elif result['analysis'].get('focus_visible', False):
             visible_focus_elements.append(result)
         else:
             invisible_focus_elements.append(result)
     
+    # Batches waiting for a free request slot; bounded so the walk pauses
+    # instead of piling up screenshots when Claude falls behind
+    queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+    
+    async def enqueue(item):
+        # Fail instead of waiting forever for a slot if the consumers have stopped
+        put = asyncio.ensure_future(queue.put(item))
+        await asyncio.wait([put, consumer], return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            raise RuntimeError("Claudeの分析処理が停止したため、バッチを送信できません")
+    
+    # Set when the analysis is abandoned (e.g. on Ctrl-C), so the worker thread
+    # stops walking the page instead of waiting for a queue slot forever
+    stop = threading.Event()
+    
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(enqueue(item), loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    raise RuntimeError("分析が中断されたため、ページの走査を中止します")
+    
+    def produce():
+        # Runs in a worker thread: drives the browser through the page.
+        # Elements whose focus indicator shows up in their computed styles, and
+        # elements whose screenshots do not change on focus at all, are decided
+        # locally; only the ambiguous rest (e.g. indicators drawn by
+        # pseudo-elements or scripts) are sent to Claude, 5 per batch for better
+        # image handling.
+        nonlocal local_count, cached_count
+        batch_size = 5
+        batch_idx = 0
+        batch = []
+        for element in focus_results:
+            if stop.is_set():
+                return
+            result = decide_locally(element)
+            if result is not None:
+                local_count += 1
+                remove_screenshots(element)
+                loop.call_soon_threadsafe(categorize, result)
+                continue
+            analysis = get_cached_analysis(analysis_cache_key(element))
+            if analysis is not None:
+                result = element_details(element)
+                result["analysis"] = analysis
+                cached_count += 1
+                remove_screenshots(element)
+                loop.call_soon_threadsafe(categorize, result)
+                continue
+            batch.append(element)
+            if len(batch) == batch_size:
+                put((batch_idx, batch))
+                batch_idx += 1
+                batch = []
+        if batch:
+            put((batch_idx, batch))
+    
+    def on_batch_done(batch_idx, batch, analyzed_batch):
+        # Categorize each batch as soon as it completes and free its screenshots
+        try:
+            if isinstance(analyzed_batch, Exception):
+                print(f"エラー: バッチ {batch_idx+1} の解析中に問題が発生しました: {analyzed_batch}")
+                print("バッチをスキップして続行します...")
+            elif analyzed_batch:
+                batch_elements = {element["tab_index"]: element for element in batch}
+                for result in analyzed_batch:
+                    categorize(result)
+                    element = batch_elements.get(result.get("tab_index"))
+                    if element is not None and "analysis" in result:
+                        cache_analysis(analysis_cache_key(element), result["analysis"])
+                print(f"バッチ {batch_idx+1} の解析が完了しました")
+            else:
+                print(f"警告: バッチ {batch_idx+1} の解析結果がありません。スキップします。")
+        finally:
+            for element in batch:
+                remove_screenshots(element)
+    
+    # The Claude requests are independent and I/O-bound, so run them
+    # concurrently while the page is still being walked
+    consumer = asyncio.ensure_future(analyze_focus_batches(queue, url, on_batch_done))
+    try:
+        await loop.run_in_executor(None, produce)
+    except BaseException:
+        stop.set()
+        consumer.cancel()
+        await asyncio.wait([consumer])
+        raise
+    await enqueue(None)
+    await consumer
+    if local_count:
+        print(f"{local_count}個の要素はスタイルまたは画面の比較で判定できたため、Claudeの分析を省略します")
+    if cached_count:
+        print(f"{cached_count}個の要素は以前の分析結果を再利用したため、Claudeの分析を省略します")
+    
+    # Batches finish in any order, so restore the tab order for the report
+    visible_focus_elements.sort(key=lambda result: result.get('tab_index', 0))
+    invisible_focus_elements.sort(key=lambda result: result.get('tab_index', 0))
+    not_rendered_elements.sort(key=lambda result: result.get('tab_index', 0))
+    
     # Create final report
     final_report = {
         "url": url,
-        "total_focusable_elements": len(all_analyzed_results),
+        "total_focusable_elements": analyzed_count,
         "visible_focus_elements": len(visible_focus_elements),
         "invisible_focus_elements": len(invisible_focus_elements),
         "visible_elements": visible_focus_elements,
         "invisible_elements": invisible_focus_elements,
-        "wcag_2_4_7_compliant": len(invisible_focus_elements) == 0
+        "not_rendered_focus_elements": len(not_rendered_elements),
+        "not_rendered_elements": not_rendered_elements,
+        # Focus landing on an element that paints nothing shows no indicator either
+        "wcag_2_4_7_compliant": len(invisible_focus_elements) == 0 and len(not_rendered_elements) == 0
     }
     
     return final_report
 
-def analyze_focus_batch(focus_batch, initial_screenshot, url):
+def _run_async(coro):
     """
-    Use Claude to analyze focus visibility for a batch of elements
+    Run a coroutine to completion on the module's event loop. The loop is kept
+    for the life of the process so the shared client's connections stay usable
+    from one page to the next.
     """
-    client = anthropic.Anthropic(
-        api_key=ANTHROPIC_API_KEY,
-    )
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+    task = _event_loop.create_task(coro)
+    try:
+        return _event_loop.run_until_complete(task)
+    except BaseException:
+        # A KeyboardInterrupt arrives outside the coroutine; cancel it and let
+        # it clean up, so no worker thread is left waiting on the loop
+        task.cancel()
+        try:
+            _event_loop.run_until_complete(task)
+        except BaseException:
+            pass
+        raise
+
+def _get_client():
+    """
+    Return the shared async Anthropic client, creating it on first use so all
+    batches reuse one HTTP connection pool
+    """
+    global _client
+    if _client is None:
+        _client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+        )
+    return _client
+
+def _close_client():
+    """
+    Close the shared client's connection pool and the event loop it runs on.
+    Registered with atexit so the connections are released cleanly once, at
+    the end of the run, instead of after every batch.
+    """
+    global _client, _event_loop
+    if _event_loop is None:
+        return
+    if _client is not None:
+        _event_loop.run_until_complete(_client.close())
+        _client = None
+    _event_loop.close()
+    _event_loop = None
+
+atexit.register(_close_client)
+
+async def analyze_focus_batches(queue, url, on_batch_done):
+    """
+    Analyze the (batch_idx, batch) items put on queue until a None item
+    arrives, with at most MAX_CONCURRENT_REQUESTS requests in flight.
+    on_batch_done(batch_idx, batch, result) is called as each batch completes,
+    where result is the analyzed elements, None, or the exception raised while
+    analyzing that batch.
+    """
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                # Pass the end marker on to the other workers
+                queue.put_nowait(None)
+                return
+            batch_idx, batch = item
+            try:
+                result = await analyze_focus_batch(batch, url)
+            except Exception as e:
+                result = e
+            # A failing callback must not stop the worker, or the queue is no
+            # longer drained
+            try:
+                on_batch_done(batch_idx, batch, result)
+            except Exception as e:
+                print(f"エラー: バッチ {batch_idx+1} の結果の処理中に問題が発生しました: {e}")
     
-    elements_data = []
+    await asyncio.gather(*(worker() for _ in range(MAX_CONCURRENT_REQUESTS)))
+
+async def analyze_focus_batch(focus_batch, url):
+    """
+    Use Claude to analyze focus visibility for a batch of elements
+    """
+    client = _get_client()
     
     # Prepare element data without the full screenshots
-    for element in focus_batch:
-        element_data = {
-            "tab_index": element["tab_index"],
-            "element_tag": element["element_tag"],
-            "element_type": element["element_type"],
-            "element_id": element["element_id"],
-            "element_class": element["element_class"],
-            "element_text": element["element_text"],
-            "element_role": element["element_role"],
-            "element_xpath": element["element_xpath"]
-        }
-        elements_data.append(element_data)
+    elements_data = [element_details(element) for element in focus_batch]
     
     # Format the elements data as JSON
     elements_json = json.dumps({"elements": elements_data}, ensure_ascii=False, indent=2)
     
-    # Create media blocks for the images
-    media_blocks = []
-    for i, element in enumerate(focus_batch):
-        # Add before focus image
-        media_blocks.append({
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": "image/png",
-                "data": element["before_tab_screenshot"]
-            }
-        })
-        # Add image label
-        media_blocks.append({
-            "type": "text",
-            "text": f"画像 {i*2+1}: 要素 {element['tab_index']} ({element['element_tag']}) にフォーカスする前"
-        })
-        
-        # Add after focus image
-        media_blocks.append({
+    # Send all before/after pairs as a single contact sheet image, with a text
+    # block mapping each row to its element. Decoding and encoding the images is
+    # CPU-bound, so it runs in a worker thread to keep the other requests moving.
+    contact_sheet = await asyncio.get_running_loop().run_in_executor(None, build_contact_sheet, focus_batch)
+    row_labels = "\n".join(
+        f"行 {row + 1}: 要素 {element['tab_index']} ({element['element_tag']})"
+        for row, element in enumerate(focus_batch)
+    )
+    media_blocks = [
+        {
             "type": "image",
             "source": {
                 "type": "base64",
-                "media_type": "image/png",
-                "data": element["after_tab_screenshot"]
+                "media_type": "image/jpeg",
+                "data": base64.b64encode(contact_sheet).decode('utf-8')
             }
-        })
-        
-        # Add image label
-        media_blocks.append({
+        },
+        {
             "type": "text",
-            "text": f"画像 {i*2+2}: 要素 {element['tab_index']} ({element['element_tag']}) にフォーカスした後"
-        })
-    
-    # Example output format
-    format_example = '''{
-  "elements": [
-    {
-      "tab_index": 0,
-      "element_tag": "A",
-      "element_type": "",
-      "element_id": "main-logo",
-      "element_class": "navbar-brand",
-      "element_text": "Home",
-      "element_role": "",
-      "element_xpath": "/html/body/header/nav/a[1]",
-      "analysis": {
-        "focus_visible": true,
-        "focus_indicator_description": "Blue outline around the element with 2px thickness",
-        "compliance_techniques": [
-          "G165: Using the default focus indicator for the platform",
-          "C15: Using CSS to change the presentation of a user interface component when it receives focus"
-        ],
-        "recommendation": "Current implementation is compliant with WCAG 2.4.7"
-      }
-    }
-  ]
-}'''
+            "text": f"コンタクトシートの各行（上から順に）: 左がフォーカスする前、右がフォーカスした後\n{row_labels}"
+        }
+    ]
     
-    # Create the prompt with task description and examples
-    prompt = f"""# あなたはWCAG 2.4.7 フォーカス可視性の評価を専門とするアクセシビリティテストの専門家です。あなたの任務は、要素がキーボードフォーカスを受けた時に可視的なフォーカス表示があるかどうかを分析することです。
-
-# WCAG 2.4.7 フォーカス可視性の要件:
-キーボード操作可能なユーザーインターフェースには、キーボードフォーカスインジケータが視覚的に確認できる操作モードがあること。
-
-# 各要素について、2つの画像が表示されます:
-1. 要素がフォーカスを受ける前（前のタブの後）
-2. 要素がフォーカスを受けた後（現在のタブ）
-
-これらの画像を比較して、要素がキーボードフォーカスを受けた時に視覚的なフォーカス表示があるかどうかを判断してください。
-
-# 一般的なフォーカス表示には以下が含まれます:
-- アウトライン（実線、点線、破線）
-- 背景色の変化
-- 境界線の変化
-- ボックスシャドウ
-- テキスト色の変化
-- 下線やその他の装飾
-- サイズや形状の変化
-
-# 各要素について、以下を判断してください:
-1. 視覚的なフォーカス表示があるか？ (true/false)
-2. 表示がある場合、そのフォーカス表示を説明してください
-3. 使用されているWCAG技術を特定してください:
-   - G165: プラットフォームのデフォルトフォーカス表示を使用
-   - G195: 作成者が提供する視覚的なフォーカス表示を使用
-   - C15: フォーカスを受けた時にCSSで表示を変更
-   - C40: 十分なコントラストを持つ二色のフォーカス表示を作成
-   - SCR31: スクリプトを使用してフォーカス時に背景色または境界線を変更
-   - F78: フォーカス表示を削除または非表示にするスタイリングの失敗
-
-# 以下の画像は、フォーカス可視性のテスト対象となる要素を示しています。
-# 「フォーカス前」と「フォーカス後」の画像のペアを注意深く分析してください。
-
-# テスト対象のページ: {url}
-
-# 回答のフォーマット:
-{format_example}
-
-# 以下の要素を分析してください:
-{elements_json}"""
+    # Only the page and the elements are batch-specific; the instructions are
+    # in the cached system prompt
+    prompt = f"# テスト対象のページ: {url}\n\n# 以下の要素を分析してください:\n{elements_json}"
 
     print("Claudeにフォーカス可視性分析リクエストを送信中...")
     
     try:
-        # Create message with text and images
-        message = client.messages.create(
+        # Create message with text and images; forcing the report tool makes
+        # Claude return the analysis as already-parsed structured data
+        message = await client.messages.create(
             model="claude-3-5-sonnet-20240620",
             max_tokens=4096,
-            system="あなたはWCAGコンプライアンス評価、特にキーボードユーザー向けのフォーカス可視性に特化したアクセシビリティテストの専門家です。",
+            system=_SYSTEM_PROMPT,
+            tools=[_REPORT_TOOL],
+            tool_choice={"type": "tool", "name": _REPORT_TOOL["name"]},
             messages=[
                 {"role": "user", "content": media_blocks + [{"type": "text", "text": prompt}]}
             ]
         )
         
-        response_text = str(message.content[0].text)
         print("\n=== Claudeの分析結果 ===")
+        result = None
+        response_text = ""
+        for block in message.content:
+            if block.type == "tool_use":
+                result = block.input
+                break
+            if block.type == "text":
+                response_text += block.text
         if DEBUG:
-            print(response_text)
+            print(json.dumps(result, ensure_ascii=False, indent=2) if result is not None else response_text)
     except Exception as e:
         print(f"\nエラー: Claudeへのリクエスト中に問題が発生しました: {e}")
         print("このバッチはスキップします。")
         return None
     
     try:
-        # Extract and parse JSON from response
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != -1:
-            json_str = response_text[start_idx:end_idx]
-            json_str = json_str.replace("'", '"').replace('\\n', '\n').strip()
-            
-            if DEBUG:
-                print("=== フォーマット済みJSONデータ ===")
-                print(json_str)
+        if result is None:
+            # Fall back to the JSON object embedded in a plain text answer
+            match = _JSON_RE.search(response_text)
+            if not match:
+                print("警告: 応答からJSONデータを抽出できませんでした")
+                return None
             
+            json_str = match.group(0)
             try:
                 result = json.loads(json_str)
-                if 'elements' in result:
-                    print(f"{len(result['elements'])}個の要素の分析が完了しました")
-                    return result['elements']
-                else:
-                    print("警告: 応答にelementsフィールドがありません")
             except json.JSONDecodeError as je:
                 print(f"エラー: JSONデータの解析に失敗しました: {je}")
                 if DEBUG:
                     print("=== 問題のあるJSONデータ ===")
                     print(json_str[:500] + "..." if len(json_str) > 500 else json_str)
+                return None
+        
+        elements = result.get('elements') if isinstance(result, dict) else None
+        if isinstance(elements, str):
+            # The tool input sometimes carries the list as a JSON string
+            elements = json.loads(elements)
+        if isinstance(elements, list):
+            # Keep only well-formed results so they can be categorized safely
+            valid_elements = [
+                element for element in elements
+                if isinstance(element, dict) and isinstance(element.get('analysis'), dict)
+            ]
+            if len(valid_elements) < len(elements):
+                print(f"警告: 形式が正しくない {len(elements) - len(valid_elements)} 個の分析結果をスキップします")
+            print(f"{len(valid_elements)}個の要素の分析が完了しました")
+            return valid_elements
         else:
-            print("警告: 応答からJSONデータを抽出できませんでした")
+            print("警告: 応答にelementsフィールドがありません")
     except Exception as e:
         print(f"エラー: Claudeの応答の処理中に問題が発生しました: {e}")
     
@@ -495,76 +1337,95 @@ def analyze_focus_batch(focus_batch, initial_screenshot, url):
 
 # Removed the save_results_as_html function as it's no longer needed for command line only output
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python wcag_focus_visible_checker.py url")
-        sys.exit(1)
-
-    url = sys.argv[1]
+def print_report(url, results):
+    """
+    Print the detailed focus visibility report for one URL to the console
+    """
+    # Print detailed results to console
+    print("\n======================================")
+    print("WCAG 2.4.7 フォーカス可視性 分析レポート")
+    print("======================================")
+    print(f"URL: {url}")
+    print(f"フォーカス可能な要素の合計: {results['total_focusable_elements']}")
+    print(f"フォーカス可視化されている要素: {results['visible_focus_elements']}")
+    print(f"フォーカス可視化されていない要素: {results['invisible_focus_elements']}")
+    print(f"描画されていないためフォーカスが見えない要素: {results['not_rendered_focus_elements']}")
+    print(f"WCAG 2.4.7 準拠状況: {'準拠' if results['wcag_2_4_7_compliant'] else '非準拠'}")
     
-    try:
-        # Check focus visibility
-        print(f"{url} のフォーカス可視性チェックを開始")
-        results = check_focus_visibility(url)
-        
-        # Print detailed results to console
-        print("\n======================================")
-        print("WCAG 2.4.7 フォーカス可視性 分析レポート")
-        print("======================================")
-        print(f"URL: {url}")
-        print(f"フォーカス可能な要素の合計: {results['total_focusable_elements']}")
-        print(f"フォーカス可視化されている要素: {results['visible_focus_elements']}")
-        print(f"フォーカス可視化されていない要素: {results['invisible_focus_elements']}")
-        print(f"WCAG 2.4.7 準拠状況: {'準拠' if results['wcag_2_4_7_compliant'] else '非準拠'}")
-        
-        # Print elements without visible focus
-        if not results['wcag_2_4_7_compliant']:
-            print("\n== フォーカス可視化されていない要素 ==")
-            for element in results['invisible_elements']:
-                try:
-                    print(f"\n要素 {element['tab_index']}: {element['element_tag']}")
-                    print(f"  ID: {element.get('element_id', '') or 'なし'}")
-                    print(f"  クラス: {element.get('element_class', '') or 'なし'}")
-                    print(f"  テキスト: {element.get('element_text', '') or 'なし'}")
-                    print(f"  XPath: {element.get('element_xpath', 'なし')}")
-                    
-                    if 'analysis' in element:
-                        if 'focus_indicator_description' in element['analysis']:
-                            print(f"  分析: {element['analysis']['focus_indicator_description']}")
-                        else:
-                            print("  分析: 情報なし")
-                            
-                        print(f"  推奨事項: {element['analysis'].get('recommendation', 'この要素にフォーカス表示を追加してください')}")
-                    else:
-                        print("  分析: 情報なし")
-                        print("  推奨事項: この要素にフォーカス表示を追加してください")
-                except Exception as e:
-                    print(f"  エラー: この要素の表示中に問題が発生しました: {e}")
-        
-        # Print elements with visible focus
-        print("\n== フォーカス可視化されている要素 ==")
-        for element in results['visible_elements']:
+    # Print elements without visible focus
+    if results['invisible_elements']:
+        print("\n== フォーカス可視化されていない要素 ==")
+        for element in results['invisible_elements']:
             try:
                 print(f"\n要素 {element['tab_index']}: {element['element_tag']}")
                 print(f"  ID: {element.get('element_id', '') or 'なし'}")
                 print(f"  クラス: {element.get('element_class', '') or 'なし'}")
                 print(f"  テキスト: {element.get('element_text', '') or 'なし'}")
+                print(f"  XPath: {element.get('element_xpath', 'なし')}")
                 
-                if 'analysis' in element and 'focus_indicator_description' in element['analysis']:
-                    print(f"  フォーカス表示: {element['analysis']['focus_indicator_description']}")
+                if 'analysis' in element:
+                    if 'focus_indicator_description' in element['analysis']:
+                        print(f"  分析: {element['analysis']['focus_indicator_description']}")
+                    else:
+                        print("  分析: 情報なし")
+                        
+                    print(f"  推奨事項: {element['analysis'].get('recommendation', 'この要素にフォーカス表示を追加してください')}")
                 else:
-                    print("  フォーカス表示: 情報なし")
-                    
-                if 'analysis' in element and 'compliance_techniques' in element['analysis']:
-                    print("  使用されている技術:")
-                    for technique in element['analysis']['compliance_techniques']:
-                        print(f"    - {technique}")
+                    print("  分析: 情報なし")
+                    print("  推奨事項: この要素にフォーカス表示を追加してください")
             except Exception as e:
                 print(f"  エラー: この要素の表示中に問題が発生しました: {e}")
-        
+    
+    # Print focusable elements that are not rendered while focused
+    if results['not_rendered_elements']:
+        print("\n== 描画されていないためフォーカスが見えない要素 ==")
+        for element in results['not_rendered_elements']:
+            print(f"\n要素 {element['tab_index']}: {element['element_tag']}")
+            print(f"  ID: {element.get('element_id', '') or 'なし'}")
+            print(f"  XPath: {element.get('element_xpath', 'なし')}")
+            print(f"  推奨事項: {element['analysis'].get('recommendation', '')}")
+    
+    # Print elements with visible focus
+    print("\n== フォーカス可視化されている要素 ==")
+    for element in results['visible_elements']:
+        try:
+            print(f"\n要素 {element['tab_index']}: {element['element_tag']}")
+            print(f"  ID: {element.get('element_id', '') or 'なし'}")
+            print(f"  クラス: {element.get('element_class', '') or 'なし'}")
+            print(f"  テキスト: {element.get('element_text', '') or 'なし'}")
+            
+            if 'analysis' in element and 'focus_indicator_description' in element['analysis']:
+                print(f"  フォーカス表示: {element['analysis']['focus_indicator_description']}")
+            else:
+                print("  フォーカス表示: 情報なし")
+                
+            if 'analysis' in element and 'compliance_techniques' in element['analysis']:
+                print("  使用されている技術:")
+                for technique in element['analysis']['compliance_techniques']:
+                    print(f"    - {technique}")
+        except Exception as e:
+            print(f"  エラー: この要素の表示中に問題が発生しました: {e}")
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python wcag_focus_visible_checker.py url [url ...]")
+        sys.exit(1)
+
+    urls = sys.argv[1:]
+    
+    try:
+        # Check focus visibility, reusing one browser for all URLs
+        scan_results = scan_urls(urls)
     except Exception as e:
         print(f"エラー: {e}")
         sys.exit(1)
+    
+    for url, results in scan_results:
+        if results is not None:
+            print_report(url, results)
+    
+    if any(results is None for _, results in scan_results):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()